@@ -2,7 +2,13 @@
 import os
 import sys
 import argparse
+import hashlib
 import io
+import itertools
+import multiprocessing
+import shutil
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
 
 import numpy as np
@@ -32,46 +38,44 @@ CAM_RAD = 2.5
 CAM_FOV_DEG = 49.1
 
 
-def spherical_to_cartesian(theta_deg: float, phi_deg: float, radius: float) -> np.ndarray:
-    """Convert spherical coordinates (in degrees) to 3D Cartesian coordinates."""
-    theta = np.deg2rad(theta_deg)
-    phi = np.deg2rad(phi_deg)
-
-    x = radius * np.cos(phi) * np.cos(theta)
-    y = radius * np.sin(phi)
-    z = radius * np.cos(phi) * np.sin(theta)
-
-    return np.array([x, y, z], dtype=np.float32)
-
-
-def look_at(eye: np.ndarray, target: np.ndarray | None = None, up: np.ndarray | None = None) -> np.ndarray:
+def build_poses(theta_deg: np.ndarray, phi_deg: np.ndarray, radius: float) -> np.ndarray:
     """
-    Build a camera pose matrix similar to utils.coords.look_at used in render_service/render.py.
-    Returns a 4x4 world-space camera transform suitable for pyrender.
+    Build camera poses looking at the origin for all views at once.
+    theta_deg/phi_deg are (N,) azimuth/elevation angles in degrees; returns an
+    (N, 4, 4) float32 array of world-space camera transforms for pyrender.
     """
-    if target is None:
-        target = np.array([0.0, 0.0, 0.0], dtype=np.float32)
-    if up is None:
-        up = np.array([0.0, 1.0, 0.0], dtype=np.float32)
+    theta = np.deg2rad(np.asarray(theta_deg, dtype=np.float32))
+    phi = np.deg2rad(np.asarray(phi_deg, dtype=np.float32))
 
-    eye = np.asarray(eye, dtype=np.float32)
-    target = np.asarray(target, dtype=np.float32)
-    up = np.asarray(up, dtype=np.float32)
+    eyes = radius * np.stack(
+        [np.cos(phi) * np.cos(theta), np.sin(phi), np.cos(phi) * np.sin(theta)],
+        axis=1,
+    ).astype(np.float32)
+    up = np.array([0.0, 1.0, 0.0], dtype=np.float32)
 
-    forward = target - eye
-    forward /= np.linalg.norm(forward) + 1e-8
+    forward = -eyes
+    forward /= np.linalg.norm(forward, axis=1, keepdims=True) + 1e-8
 
     right = np.cross(forward, up)
-    right /= np.linalg.norm(right) + 1e-8
+    right /= np.linalg.norm(right, axis=1, keepdims=True) + 1e-8
 
     up_vec = np.cross(right, forward)
 
-    pose = np.eye(4, dtype=np.float32)
-    pose[0, :3] = right
-    pose[1, :3] = up_vec
-    pose[2, :3] = -forward
-    pose[:3, 3] = eye
-    return pose
+    poses = np.zeros((len(eyes), 4, 4), dtype=np.float32)
+    poses[:, 0, :3] = right
+    poses[:, 1, :3] = up_vec
+    poses[:, 2, :3] = -forward
+    poses[:, :3, 3] = eyes
+    poses[:, 3, 3] = 1.0
+    return poses
+
+
+# The grid views are fixed, so their camera poses are built once at import
+GRID_POSES = build_poses(
+    THETA_ANGLES[GRID_VIEW_INDICES].astype("float32"),
+    PHI_ANGLES[GRID_VIEW_INDICES].astype("float32"),
+    CAM_RAD,
+)
 
 
 def combine_images4(images: list[Image.Image]) -> Image.Image:
@@ -95,146 +99,221 @@ def combine_images4(images: list[Image.Image]) -> Image.Image:
     return combined_image
 
 
-def render_glb_grid(glb_path: Path) -> Image.Image | None:
+def downsample_image(image_array: np.ndarray) -> Image.Image:
+    """Downsample an SSAA render with a high-quality Lanczos filter for antialiasing."""
+    return Image.fromarray(image_array).resize(
+        (IMG_WIDTH, IMG_HEIGHT),
+        resample=Image.LANCZOS,
+    )
+
+
+def load_glb(glb_path: Path) -> tuple[bytes, trimesh.Trimesh]:
     """
-    Render a GLB file into a 2x2 grid of views.
+    Read, hash and decode a GLB file.
+
+    Runs in a worker process so that mesh decoding overlaps rendering in the main
+    process. Returns the blake2b content digest together with the loaded mesh.
+    """
+    glb_bytes = glb_path.read_bytes()
+    if not glb_bytes:
+        raise ValueError(f"Empty GLB file: {glb_path}")
+
+    digest = hashlib.blake2b(glb_bytes, digest_size=16).digest()
+    mesh = trimesh.load(
+        file_obj=io.BytesIO(glb_bytes),
+        file_type="glb",
+        force="mesh",
+    )
+    return digest, mesh
+
+
+def make_renderer() -> pyrender.OffscreenRenderer:
+    """Create the offscreen renderer at 2x supersampled resolution for antialiasing."""
+    ssaa_factor = 2
+    return pyrender.OffscreenRenderer(IMG_WIDTH * ssaa_factor, IMG_HEIGHT * ssaa_factor)
+
+
+def render_prepared(mesh: trimesh.Trimesh, renderer: pyrender.OffscreenRenderer) -> Image.Image:
+    """
+    Render a loaded mesh into a 2x2 grid of views.
 
     This mirrors the logic of grid_from_glb_bytes in render-service/render.py:
-    - load GLB with trimesh
     - convert to pyrender mesh, disable mipmaps
     - render multiple views with OffscreenRenderer (with SSAA + downsampling)
     - combine the 4 selected views into a 2x2 grid.
     """
-    try:
-        with open(glb_path, "rb") as f:
-            glb_bytes = f.read()
-
-        if not glb_bytes:
-            print(f"[ERROR] Empty GLB file: {glb_path}")
-            return None
-
-        # Load mesh
-        mesh = trimesh.load(
-            file_obj=io.BytesIO(glb_bytes),
-            file_type="glb",
-            force="mesh",
-        )
-
-        # Create scene
-        scene = pyrender.Scene(bg_color=[255, 255, 255, 0], ambient_light=[0.3, 0.3, 0.3])
-
-        # Convert to pyrender mesh
-        pyr_mesh = pyrender.Mesh.from_trimesh(mesh, smooth=True)
-
-        # Disable mipmaps on all textures
-        for primitive in pyr_mesh.primitives:
-            if primitive.material is not None:
-                mat = primitive.material
-                for attr in [
-                    "baseColorTexture",
-                    "metallicRoughnessTexture",
-                    "normalTexture",
-                    "occlusionTexture",
-                    "emissiveTexture",
-                ]:
-                    tex = getattr(mat, attr, None)
-                    if tex is not None and hasattr(tex, "sampler") and tex.sampler is not None:
-                        tex.sampler.minFilter = GL_LINEAR
-                        tex.sampler.magFilter = GL_LINEAR
-
-        scene.add(pyr_mesh)
-
-        # Camera
-        cam = pyrender.PerspectiveCamera(yfov=CAM_FOV_DEG * np.pi / 180.0)
-        cam_node = scene.add(cam)
-
-        # Light
-        light = pyrender.DirectionalLight(color=[255, 255, 255], intensity=3.0)
-        light_node = scene.add(light)
-
-        # View angles (use same indexing strategy as original script)
-        theta_angles = THETA_ANGLES[GRID_VIEW_INDICES].astype("float32")
-        phi_angles = PHI_ANGLES[GRID_VIEW_INDICES].astype("float32")
-
-        # 2x supersampling for antialiasing
-        ssaa_factor = 2
-        render_width = IMG_WIDTH * ssaa_factor
-        render_height = IMG_HEIGHT * ssaa_factor
-        renderer = pyrender.OffscreenRenderer(render_width, render_height)
-
-        images: list[Image.Image] = []
-
-        for theta, phi in zip(theta_angles, phi_angles):
-            cam_pos = spherical_to_cartesian(theta, phi, CAM_RAD)
-            pose = look_at(cam_pos)
-
+    # Create scene
+    scene = pyrender.Scene(bg_color=[255, 255, 255, 0], ambient_light=[0.3, 0.3, 0.3])
+
+    # Convert to pyrender mesh
+    # smooth=True reuses mesh.vertex_normals, which trimesh fills from the GLB's
+    # NORMAL attribute when present; smooth=False would flat-shade and unweld faces.
+    pyr_mesh = pyrender.Mesh.from_trimesh(mesh, smooth=True)
+
+    # Disable mipmaps on all textures
+    for primitive in pyr_mesh.primitives:
+        if primitive.material is not None:
+            mat = primitive.material
+            for attr in [
+                "baseColorTexture",
+                "metallicRoughnessTexture",
+                "normalTexture",
+                "occlusionTexture",
+                "emissiveTexture",
+            ]:
+                tex = getattr(mat, attr, None)
+                if tex is not None and hasattr(tex, "sampler") and tex.sampler is not None:
+                    tex.sampler.minFilter = GL_LINEAR
+                    tex.sampler.magFilter = GL_LINEAR
+
+    scene.add(pyr_mesh)
+
+    # Camera
+    cam = pyrender.PerspectiveCamera(yfov=CAM_FOV_DEG * np.pi / 180.0)
+    cam_node = scene.add(cam)
+
+    # Light
+    light = pyrender.DirectionalLight(color=[255, 255, 255], intensity=3.0)
+    light_node = scene.add(light)
+
+    # The GL context is bound to this thread, so only the CPU-side downsample
+    # is offloaded; it overlaps with rendering of the next view.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = []
+        for pose in GRID_POSES:
             scene.set_pose(cam_node, pose)
             scene.set_pose(light_node, pose)
 
             image_array, _ = renderer.render(scene)
+            futures.append(executor.submit(downsample_image, image_array))
 
-            # Downsample with high-quality Lanczos filter for antialiasing
-            image_pil = Image.fromarray(image_array).resize(
-                (IMG_WIDTH, IMG_HEIGHT),
-                resample=Image.LANCZOS,
-            )
-            images.append(image_pil)
+        images: list[Image.Image] = [future.result() for future in futures]
 
-        if not images:
-            print(f"[WARN] No views rendered for {glb_path}")
-            return None
+    return combine_images4(images)
 
-        grid = combine_images4(images)
-        return grid
 
-    except Exception as e:
-        print(f"[ERROR] Failed to render GLB {glb_path}: {e}")
-        return None
+def iter_loaded(
+    pool: ProcessPoolExecutor,
+    paths: list[Path],
+    max_in_flight: int,
+) -> Iterator[tuple[Path, Future]]:
+    """Submit load_glb jobs lazily and yield (path, future) pairs as they complete."""
+    path_iter = iter(paths)
+    pending = {pool.submit(load_glb, path): path for path in itertools.islice(path_iter, max_in_flight)}
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            path = pending.pop(future)
+            next_path = next(path_iter, None)
+            if next_path is not None:
+                pending[pool.submit(load_glb, next_path)] = next_path
+            yield path, future
+
+
+def copy_when_saved(save_future: Future, src: Path, dst: Path) -> None:
+    """Copy an already rendered grid once its own save job has finished."""
+    save_future.result()
+    if src != dst:
+        shutil.copyfile(src, dst)
+
+
+def iter_glbs(root: str | Path) -> Iterator[str]:
+    """Recursively yield .glb file paths under root using os.scandir (no per-entry stat)."""
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_glbs(entry.path)
+            elif entry.name.endswith(".glb"):
+                yield entry.path
 
 
 def process_directory(
     input_dir: Path,
     output_folder: Path,
     remaining: int | None,
+    workers: int,
 ) -> int:
-    """Recursively render .glb files and mirror their structure inside the output root."""
-    candidates = sorted(
-        list(input_dir.rglob("*.glb")),
-        key=lambda path: path.as_posix(),
-    )
+    """
+    Recursively render .glb files and mirror their structure inside the output root.
+
+    GLBs are decoded by a pool of worker processes, rendered one at a time in this
+    process (which owns the GL context) and saved by a small thread pool.
+
+    Returns the number of files charged against ``remaining``: every selected file,
+    whether it was already rendered, rendered now or failed.
+    """
+    # Sorting the path strings is cheap next to the walk and keeps the
+    # --N_instances selection deterministic
+    candidates = sorted(iter_glbs(input_dir))
 
     if not candidates:
         print(f"[WARN] No .glb files found in {input_dir}")
         return 0
 
-    processed = 0
-    for glb_path in tqdm(candidates, desc=f"Rendering {input_dir.name}", unit="file"):
-        if remaining is not None and remaining <= 0:
-            break
-
-        out_dir = output_folder / input_dir.name
-        out_dir.mkdir(parents=True, exist_ok=True)
-        out_path = out_dir / f"{glb_path.stem}.png"
-
-        if out_path.exists():
-            processed += 1
-            if remaining is not None:
-                remaining -= 1
-            continue
-
+    out_dir = output_folder / input_dir.name
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # Existing outputs are listed once instead of stat-ing each expected PNG
+    with os.scandir(out_dir) as entries:
+        done = {entry.name[: -len(".png")] for entry in entries if entry.name.endswith(".png")}
+
+    # Every file attempted counts towards --N_instances, including failed renders,
+    # since the selection has to be made before any render has finished
+    if remaining is not None:
+        candidates = candidates[: max(remaining, 0)]
+    # Outputs are named by stem only, so of several GLBs sharing a stem in different
+    # subfolders the first in sorted order is rendered and the rest are skipped
+    to_render: list[Path] = []
+    for glb_path in map(Path, candidates):
+        if glb_path.stem not in done:
+            done.add(glb_path.stem)
+            to_render.append(glb_path)
+
+    if not to_render:
+        return len(candidates)
+
+    # Content hash -> (save job, output path) of the first grid rendered for it,
+    # so duplicate GLBs are copied instead of being rendered again
+    saved_by_digest: dict[bytes, tuple[Future, Path]] = {}
+    save_jobs: list[tuple[Path, Future]] = []
+
+    renderer = make_renderer()
+    try:
+        # Workers are spawned rather than forked so they never inherit GL state
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as load_pool, ThreadPoolExecutor(max_workers=2) as save_pool:
+            loaded = iter_loaded(load_pool, to_render, max_in_flight=2 * workers)
+            for glb_path, load_future in tqdm(
+                loaded, total=len(to_render), desc=f"Rendering {input_dir.name}", unit="file"
+            ):
+                out_path = out_dir / f"{glb_path.stem}.png"
+                try:
+                    digest, mesh = load_future.result()
+                    duplicate_of = saved_by_digest.get(digest)
+                    if duplicate_of is not None:
+                        save_jobs.append((glb_path, save_pool.submit(copy_when_saved, *duplicate_of, out_path)))
+                        continue
+
+                    grid = render_prepared(mesh, renderer)
+                except Exception as e:
+                    tqdm.write(f"[WARN] Exception rendering {glb_path}: {e}")
+                    continue
+
+                save_future = save_pool.submit(grid.save, out_path)
+                saved_by_digest[digest] = (save_future, out_path)
+                save_jobs.append((glb_path, save_future))
+    finally:
+        renderer.delete()
+
+    for glb_path, save_future in save_jobs:
         try:
-            grid = render_glb_grid(glb_path)
-            if grid is not None:
-                grid.save(out_path)
-                processed += 1
-                if remaining is not None:
-                    remaining -= 1
-            else:
-                tqdm.write(f"[WARN] Failed to render {glb_path}")
+            save_future.result()
         except Exception as e:
-            tqdm.write(f"[WARN] Exception rendering {glb_path}: {e}")
+            tqdm.write(f"[WARN] Failed to save render for {glb_path}: {e}")
 
-    return processed
+    return len(candidates)
 
 
 def main() -> None:
@@ -258,7 +337,13 @@ def main() -> None:
         "--N_instances",
         type=int,
         default=None,
-        help="Maximum number of files to render (useful for debugging)",
+        help="Maximum number of files to attempt, counting existing outputs and failures (useful for debugging)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=max(1, (os.cpu_count() or 2) - 1),
+        help="Number of processes decoding GLB files while the main process renders",
     )
     args = parser.parse_args()
 
@@ -275,13 +360,14 @@ def main() -> None:
         if not in_folder.exists():
             sys.stderr.write(f"[WARN] Skipping missing directory: {in_folder}\n")
             continue
-        processed = process_directory(
+        charged = process_directory(
             in_folder,
             out_folder,
             remaining=remaining,
+            workers=args.workers,
         )
         if remaining is not None:
-            remaining -= processed
+            remaining -= charged
 
 
 if __name__ == "__main__":
@@ -11,9 +11,22 @@ IMG_WIDTH = 518
 IMG_HEIGHT = 518
 GRID_VIEW_GAP = 5
 BG_COLOR = [1.0, 1.0, 1.0]
+SSAA_FACTOR = 1         # GLB supersampling on top of pyrender's 4x MSAA (1 = native resolution)
 
 # Camera settings
 CAM_RAD = 2.5           # Used for Gaussian Splat (PLY) rendering
 CAM_RAD_MESH = 2.0      # Used for Mesh (GLB) rendering - adjust as needed
 CAM_FOV_DEG = 49.1
-REF_BBOX_SIZE = 1.5
\ No newline at end of file
+REF_BBOX_SIZE = 1.5
+
+# Precomputed grid views (these do not depend on the rendered model)
+GRID_THETA_ANGLES = THETA_ANGLES[GRID_VIEW_INDICES].astype(np.float32)
+GRID_PHI_ANGLES = PHI_ANGLES[GRID_VIEW_INDICES].astype(np.float32)
+GRID_THETA_RAD = np.deg2rad(GRID_THETA_ANGLES)
+GRID_PHI_RAD = np.deg2rad(GRID_PHI_ANGLES)
+# Mesh camera positions, same formula as utils.coords.spherical_to_cartesian
+GRID_EYES = CAM_RAD_MESH * np.stack([
+    np.cos(GRID_PHI_RAD) * np.sin(GRID_THETA_RAD),
+    -np.sin(GRID_PHI_RAD),
+    np.cos(GRID_PHI_RAD) * np.cos(GRID_THETA_RAD),
+], axis=1).astype(np.float32)
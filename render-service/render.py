@@ -1,7 +1,22 @@
+from collections import OrderedDict
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+import ctypes.util
+import hashlib
 import io
+import os
+import threading
 from loguru import logger
 import numpy as np
 from PIL import Image
+
+# Resolve the headless GL backend once, before PyOpenGL and pyrender are imported.
+# Without a display pyrender would fall back to pyglet and fail on the first render;
+# an explicit PYOPENGL_PLATFORM (as set in the Dockerfile) always wins.
+if "PYOPENGL_PLATFORM" not in os.environ and not os.environ.get("DISPLAY"):
+    os.environ["PYOPENGL_PLATFORM"] = "egl" if ctypes.util.find_library("EGL") else "osmesa"
+logger.info(f"OpenGL platform: {os.environ.get('PYOPENGL_PLATFORM', 'pyglet')}")
+
 from OpenGL.GL import GL_LINEAR
 import pyrender
 import trimesh
@@ -13,10 +28,37 @@ from renderers.ply_loader import PlyLoader
 from utils import coords
 from utils import image as img_utils
 
-def grid_from_ply_bytes(ply_bytes: bytes, device: torch.device) -> bytes:
-    logger.info(f"Starting PLY rendering, payload size: {len(ply_bytes)} bytes")
+# pyrender state is kept for the lifetime of the process: building an
+# OffscreenRenderer creates a GL context, framebuffers and shader programs.
+# The lock serializes renders, but is not enough on its own: the GL context
+# stays bound to the thread that created it (with EGL, eglMakeCurrent on any
+# other thread fails with EGL_BAD_ACCESS). Every GLB render must therefore run
+# on that one thread; render_service uses a single-worker executor for this.
+_RENDER_LOCK = threading.Lock()
+_RENDERER: pyrender.OffscreenRenderer | None = None
+_RENDERER_THREAD_ID: int | None = None
+_SCENE: tuple[pyrender.Scene, pyrender.Node, pyrender.Node] | None = None
+
+# Converted meshes keyed by a hash of the GLB payload, so repeated uploads of
+# the same file skip trimesh loading and pyrender conversion
+_MESH_CACHE_SIZE = 8
+_MESH_CACHE: OrderedDict[bytes, pyrender.Mesh] = OrderedDict()
+_MESH_CACHE_LOCK = threading.Lock()
+
+# Grid camera and light poses do not depend on the mesh, so build them once
+_GRID_CAM_POSES = coords.look_at_batch(const.GRID_EYES)
+_GRID_LIGHT_POSES = coords.look_at_batch(const.GRID_EYES + np.array([1.0, 1.0, 0.0]))
+
+def _as_buffer(payload: bytes | io.BytesIO) -> io.BytesIO:
+    return payload if isinstance(payload, io.BytesIO) else io.BytesIO(payload)
+
+
+def grid_from_ply_bytes(ply_bytes: bytes | io.BytesIO, device: torch.device, image_format: str = "png") -> bytes:
+    ply_buffer = _as_buffer(ply_bytes)
+    payload_size = ply_buffer.getbuffer().nbytes
+    logger.info(f"Starting PLY rendering, payload size: {payload_size} bytes")
     
-    if not ply_bytes:
+    if not payload_size:
         raise ValueError("Empty PLY payload")
 
     logger.debug("Initializing PlyLoader and Renderer")
@@ -24,12 +66,12 @@ def grid_from_ply_bytes(ply_bytes: bytes, device: torch.device) -> bytes:
     renderer = Renderer()
 
     logger.debug("Loading Gaussian splat data from PLY")
-    gs_data = ply_loader.from_buffer(io.BytesIO(ply_bytes))
+    gs_data = ply_loader.from_buffer(ply_buffer)
     gs_data = gs_data.send_to_device(device)
     logger.debug(f"Gaussian splat data loaded and sent to {device}")
 
-    theta_angles = const.THETA_ANGLES[const.GRID_VIEW_INDICES].astype("float32")
-    phi_angles = const.PHI_ANGLES[const.GRID_VIEW_INDICES].astype("float32")
+    theta_angles = const.GRID_THETA_ANGLES
+    phi_angles = const.GRID_PHI_ANGLES
     bg_color = torch.tensor(const.BG_COLOR, dtype=torch.float32).to(device)
     logger.debug(f"Rendering {len(theta_angles)} views at {const.IMG_WIDTH}x{const.IMG_HEIGHT}")
 
@@ -47,33 +89,131 @@ def grid_from_ply_bytes(ply_bytes: bytes, device: torch.device) -> bytes:
     )
     logger.info(f"Rendered {len(images)} views, combining into grid")
 
-    images = [Image.fromarray(img.detach().cpu().numpy()) for img in images]
-    grid = img_utils.combine4(images)
-    buffer = io.BytesIO()
-    grid.save(buffer, format="PNG")
-    buffer.seek(0)
-    png_bytes = buffer.read()
-    logger.info(f"PLY rendering complete, output size: {len(png_bytes)} bytes")
-    return png_bytes
+    grid = _combine4_on_device(images)
+    image_bytes = img_utils.encode_image(grid, image_format)
+    logger.info(f"PLY rendering complete, output size: {len(image_bytes)} bytes ({image_format})")
+    return image_bytes
+
+
+def _combine4_on_device(images: list[torch.Tensor]) -> Image.Image:
+    """Stitch 4 RGBA view tensors into the 2x2 RGB grid where they live, then copy it to the host once"""
+    height, width, gap = const.IMG_HEIGHT, const.IMG_WIDTH, const.GRID_VIEW_GAP
+    grid = torch.zeros((height * 2 + gap, width * 2 + gap, 3), dtype=torch.uint8, device=images[0].device)
+
+    # Alpha is dropped, as when combine4 pastes RGBA views onto its RGB canvas
+    grid[:height, :width] = images[0][..., :3]
+    grid[:height, width + gap:] = images[1][..., :3]
+    grid[height + gap:, :width] = images[2][..., :3]
+    grid[height + gap:, width + gap:] = images[3][..., :3]
+
+    return Image.fromarray(grid.detach().cpu().numpy())
+
+
+def _downsample(image: np.ndarray) -> Image.Image:
+    """Convert a rendered view to PIL, Lanczos-downsampling it when rendered with SSAA"""
+    if const.SSAA_FACTOR == 1:
+        return Image.fromarray(image)
+    return Image.fromarray(image).resize(
+        (const.IMG_WIDTH, const.IMG_HEIGHT),
+        resample=Image.LANCZOS
+    )
+
+
+def _get_or_make_renderer() -> pyrender.OffscreenRenderer:
+    """Return the process-wide OffscreenRenderer, creating it on first use.
+
+    Must always be called from the thread that created it, see _RENDER_LOCK.
+    """
+    global _RENDERER, _RENDERER_THREAD_ID
+    if _RENDERER is not None and threading.get_ident() != _RENDERER_THREAD_ID:
+        raise RuntimeError(
+            "OffscreenRenderer used from a thread other than the one that created it; "
+            "GLB renders must all run on one dedicated thread"
+        )
+    if _RENDERER is None:
+        # pyrender already resolves a 4x MSAA framebuffer; SSAA on top is optional
+        render_width = const.IMG_WIDTH * const.SSAA_FACTOR
+        render_height = const.IMG_HEIGHT * const.SSAA_FACTOR
+        logger.debug(f"Initializing OffscreenRenderer ({render_width}x{render_height}) with {const.SSAA_FACTOR}x SSAA")
+        _RENDERER = pyrender.OffscreenRenderer(render_width, render_height)
+        _RENDERER_THREAD_ID = threading.get_ident()
+        logger.info("OffscreenRenderer initialized successfully")
+    return _RENDERER
+
+
+def _get_or_make_scene() -> tuple[pyrender.Scene, pyrender.Node, pyrender.Node]:
+    """Return the persistent scene with its camera and light nodes, creating it on first use"""
+    global _SCENE
+    if _SCENE is None:
+        logger.debug("Creating pyrender scene")
+        scene = pyrender.Scene(bg_color=[255, 255, 255, 0], ambient_light=[0.3, 0.3, 0.3])
+
+        # Camera
+        cam = pyrender.PerspectiveCamera(yfov=const.CAM_FOV_DEG*np.pi/180.0)
+        cam_node = scene.add(cam)
+        logger.debug("Camera added to scene")
+
+        # Light
+        light = pyrender.DirectionalLight(color=[255,255,255], intensity=6.0)
+        light_node = scene.add(light)
+        logger.debug("Light added to scene")
 
+        _SCENE = (scene, cam_node, light_node)
+    return _SCENE
 
 
-def grid_from_glb_bytes(glb_bytes: bytes):
-    logger.info(f"Starting GLB rendering, payload size: {len(glb_bytes)} bytes")
+def _cached_mesh(key: bytes) -> pyrender.Mesh | None:
+    with _MESH_CACHE_LOCK:
+        pyr_mesh = _MESH_CACHE.get(key)
+        if pyr_mesh is not None:
+            _MESH_CACHE.move_to_end(key)
+        return pyr_mesh
+
+
+def _cache_mesh(key: bytes, pyr_mesh: pyrender.Mesh) -> None:
+    with _MESH_CACHE_LOCK:
+        _MESH_CACHE[key] = pyr_mesh
+        _MESH_CACHE.move_to_end(key)
+        while len(_MESH_CACHE) > _MESH_CACHE_SIZE:
+            _MESH_CACHE.popitem(last=False)
+
+
+def grid_from_glb_bytes(glb_bytes: bytes | io.BytesIO, image_format: str = "png") -> bytes:
+    glb_buffer = _as_buffer(glb_bytes)
+    logger.info(f"Starting GLB rendering, payload size: {glb_buffer.getbuffer().nbytes} bytes")
+
+    key = hashlib.blake2b(glb_buffer.getbuffer(), digest_size=16).digest()
+    pyr_mesh = _cached_mesh(key)
+    if pyr_mesh is not None:
+        logger.debug(f"Mesh cache hit: {key.hex()}")
+        return _render_mesh_grid(pyr_mesh, image_format)
     
     logger.debug("Loading mesh with trimesh")
     mesh = trimesh.load(
-        file_obj=io.BytesIO(glb_bytes),
+        file_obj=glb_buffer,
         file_type='glb',
         force='mesh'
     )
     logger.debug(f"Mesh loaded: {mesh}")
-    
-    logger.debug("Creating pyrender scene")
-    scene = pyrender.Scene(bg_color=[255, 255, 255, 0], ambient_light=[0.3, 0.3, 0.3])
+    pyr_mesh = _to_pyrender_mesh(mesh)
+    _cache_mesh(key, pyr_mesh)
+    return _render_mesh_grid(pyr_mesh, image_format)
 
+
+def warmup_glb() -> None:
+    """Initialize the persistent GLB renderer by rendering a placeholder box"""
+    grid_from_mesh(trimesh.creation.box(extents=[1.0, 1.0, 1.0]))
+
+
+def grid_from_mesh(mesh: trimesh.Trimesh, image_format: str = "png") -> bytes:
+    return _render_mesh_grid(_to_pyrender_mesh(mesh), image_format)
+
+
+def _to_pyrender_mesh(mesh: trimesh.Trimesh) -> pyrender.Mesh:
     # Convert to pyrender mesh
     logger.debug("Converting trimesh to pyrender mesh")
+    # smooth=True reuses mesh.vertex_normals, which trimesh fills from the GLB's
+    # NORMAL attribute when present; smooth=False would flat-shade and unweld faces.
     pyr_mesh = pyrender.Mesh.from_trimesh(mesh, smooth=True)
 
     # Disable mipmaps on all textures
@@ -87,60 +227,52 @@ def grid_from_glb_bytes(glb_bytes: bytes):
                     tex.sampler.minFilter = GL_LINEAR
                     tex.sampler.magFilter = GL_LINEAR
     logger.debug("Mipmaps disabled on mesh textures")
+    return pyr_mesh
 
-    scene.add(pyr_mesh)
 
-    # Camera
-    cam = pyrender.PerspectiveCamera(yfov=const.CAM_FOV_DEG*np.pi/180.0)
-    cam_node = scene.add(cam)
-    logger.debug("Camera added to scene")
+def _render_views(
+    renderer: pyrender.OffscreenRenderer, scene: pyrender.Scene, cam_node: pyrender.Node, light_node: pyrender.Node
+) -> Iterator[np.ndarray]:
+    """Render the grid views one after another, yielding each raw frame"""
+    for view_count, (theta, phi, pose, light_pose) in enumerate(
+        zip(const.GRID_THETA_ANGLES, const.GRID_PHI_ANGLES, _GRID_CAM_POSES, _GRID_LIGHT_POSES), 1
+    ):
+        scene.set_pose(cam_node, pose)
+        scene.set_pose(light_node, light_pose)
+
+        image, _ = renderer.render(scene)
+        logger.debug(f"Rendered view {view_count}: theta={theta:.2f}, phi={phi:.2f}")
+        yield image
 
-    # Light
-    light = pyrender.DirectionalLight(color=[255,255,255], intensity=6.0)
-    light_node = scene.add(light)
-    logger.debug("Light added to scene")
 
-    theta_angles = const.THETA_ANGLES[const.GRID_VIEW_INDICES].astype("float32")
-    phi_angles = const.PHI_ANGLES[const.GRID_VIEW_INDICES].astype("float32")
+def _render_mesh_grid(pyr_mesh: pyrender.Mesh, image_format: str = "png") -> bytes:
+    theta_angles = const.GRID_THETA_ANGLES
+    phi_angles = const.GRID_PHI_ANGLES
     logger.debug(f"Rendering {len(theta_angles)} theta angles x {len(phi_angles)} phi angles")
 
-    # Render with 2x supersampling for antialiasing
-    ssaa_factor = 2
-    render_width = const.IMG_WIDTH * ssaa_factor
-    render_height = const.IMG_HEIGHT * ssaa_factor
-    logger.debug(f"Initializing OffscreenRenderer ({render_width}x{render_height}) with {ssaa_factor}x SSAA")
-    renderer = pyrender.OffscreenRenderer(render_width, render_height)
-    logger.info("OffscreenRenderer initialized successfully")
+    with _RENDER_LOCK:
+        renderer = _get_or_make_renderer()
+        scene, cam_node, light_node = _get_or_make_scene()
 
-    images = []
-    view_count = 0
+        # Swap the previous request's mesh out of the persistent scene
+        for node in list(scene.mesh_nodes):
+            scene.remove_node(node)
+        scene.add(pyr_mesh)
 
-    for theta, phi in zip(theta_angles, phi_angles):
-        cam_pos = coords.spherical_to_cartesian(theta, phi, const.CAM_RAD_MESH)
-        pose = coords.look_at(cam_pos)
+        views = _render_views(renderer, scene, cam_node, light_node)
+        if const.SSAA_FACTOR > 1:
+            # Rendering must stay on this thread (the GL context is bound to it), but the
+            # CPU-side Lanczos downsample of view N overlaps rendering of view N+1
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                futures = [executor.submit(_downsample, image) for image in views]
+                images = [future.result() for future in futures]
+            logger.info(f"All {len(images)} views rendered with {const.SSAA_FACTOR}x SSAA, combining into grid")
+        else:
+            # Views are rendered at the output size, so there is nothing to downsample
+            images = [Image.fromarray(image) for image in views]
+            logger.info(f"All {len(images)} views rendered, combining into grid")
 
-        scene.set_pose(cam_node, pose)
-        light_offset = np.array([1.0, 1.0, 0]) 
-        light_pos = cam_pos + light_offset
-        light_pose = coords.look_at(light_pos)
-        scene.set_pose(light_node, light_pose)
-
-        image, _ = renderer.render(scene)
-        
-        # Downsample with high-quality Lanczos filter for antialiasing
-        image_pil = Image.fromarray(image).resize(
-            (const.IMG_WIDTH, const.IMG_HEIGHT),
-            resample=Image.LANCZOS
-        )
-        images.append(image_pil)
-        view_count += 1
-        logger.debug(f"Rendered view {view_count}: theta={theta:.2f}, phi={phi:.2f}")
-    
-    logger.info(f"All {view_count} views rendered with {ssaa_factor}x SSAA, combining into grid")
     grid = img_utils.combine4(images)
-    buffer = io.BytesIO()
-    grid.save(buffer, format="PNG")
-    buffer.seek(0)
-    png_bytes = buffer.read()
-    logger.info(f"GLB rendering complete, output size: {len(png_bytes)} bytes")
-    return png_bytes
\ No newline at end of file
+    image_bytes = img_utils.encode_image(grid, image_format)
+    logger.info(f"GLB rendering complete, output size: {len(image_bytes)} bytes ({image_format})")
+    return image_bytes
\ No newline at end of file
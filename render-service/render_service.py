@@ -1,8 +1,10 @@
 from __future__ import annotations
 import asyncio
-from typing import Literal
+from concurrent.futures import ThreadPoolExecutor
+import io
+from typing import Any, Callable, Literal
 
-from fastapi import FastAPI, File, HTTPException, Response, UploadFile
+from fastapi import FastAPI, File, Header, HTTPException, Response, UploadFile
 from loguru import logger
 import torch
 
@@ -10,6 +12,8 @@ import render
 from pathlib import Path
 
 MAX_UPLOAD_SIZE = 200 * 1024 * 1024
+# Renders waiting for or holding the render thread before new requests get a 503
+MAX_QUEUED_RENDERS = 16
 
 app = FastAPI(title="Render Service", version="1.0.0")
 
@@ -21,14 +25,15 @@ async def _warmup_render() -> None:
     loop = asyncio.get_event_loop()
     # Look for a warmup.glb next to this script (optional)
     warmup_path = Path(__file__).parent / "warmup.glb"
-    if not warmup_path.exists():
-        logger.warning(f"Warmup GLB not found at {warmup_path}; skipping warmup")
-        return
 
     try:
-        # read warmup file bytes and invoke render to trigger lazy initialization
-        payload = warmup_path.read_bytes()
-        await loop.run_in_executor(None, lambda: render.grid_from_glb_bytes(payload))
+        if warmup_path.exists():
+            # read warmup file bytes and invoke render to trigger lazy initialization
+            payload = warmup_path.read_bytes()
+            await loop.run_in_executor(app.state.render_executor, lambda: render.grid_from_glb_bytes(payload))
+        else:
+            logger.warning(f"Warmup GLB not found at {warmup_path}; warming up on a placeholder mesh")
+            await loop.run_in_executor(app.state.render_executor, render.warmup_glb)
         logger.info("Render warmup: completed successfully")
     except Exception as exc:
         # ignore errors from payload/render while still forcing initialization
@@ -37,33 +42,88 @@ async def _warmup_render() -> None:
 
 @app.on_event("startup")
 async def _on_startup() -> None:
+    # The GL context is bound to the thread that created it (render._get_or_make_renderer
+    # refuses any other), so every render, warmup included, runs on this one thread;
+    # uploads are still read concurrently on the event loop
+    app.state.render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+    app.state.queued_renders = 0
     asyncio.create_task(_warmup_render())
 
 
+@app.on_event("shutdown")
+async def _on_shutdown() -> None:
+    app.state.render_executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def _run_render(func: Callable[[], Any]) -> Any:
+    """Run func on the render thread, rejecting the request with 503 when the queue is full."""
+    if app.state.queued_renders >= MAX_QUEUED_RENDERS:
+        raise HTTPException(status_code=503, detail="Render queue is full, retry later")
+
+    app.state.queued_renders += 1
+    try:
+        return await asyncio.get_event_loop().run_in_executor(app.state.render_executor, func)
+    finally:
+        app.state.queued_renders -= 1
+
+
 def _resolve_device(preferred: str | None) -> torch.device:
     if preferred is not None:
         return torch.device(preferred)
     return torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-async def _read_upload_with_limit(file: UploadFile, max_size: int) -> bytes:
-    """Read upload file with size limit, abort early if exceeded."""
-    chunks = []
+
+def _parse_accept(accept: str) -> dict[str, float]:
+    """Map each media range in an Accept header to its q value (1.0 when omitted, 0 when malformed)."""
+    qualities: dict[str, float] = {}
+    for media_range in accept.split(","):
+        media_type, *params = (part.strip() for part in media_range.split(";"))
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[media_type.lower()] = q
+    return qualities
+
+def _negotiate_format(accept: str | None) -> tuple[str, str]:
+    """Return (image_format, media_type): WebP if the client prefers it over PNG, PNG otherwise.
+
+    WebP is lossy, so it is only chosen when image/webp is listed explicitly and its q
+    is strictly higher than the one PNG gets from image/png, image/* or */*.
+    """
+    qualities = _parse_accept(accept or "")
+    webp_q = qualities.get("image/webp", 0.0)
+    png_q = next(
+        (qualities[media_type] for media_type in ("image/png", "image/*", "*/*") if media_type in qualities),
+        0.0,
+    )
+    if webp_q > 0 and webp_q > png_q:
+        return "webp", "image/webp"
+    return "png", "image/png"
+
+async def _read_upload_with_limit(file: UploadFile, max_size: int) -> io.BytesIO:
+    """Read upload file into a single buffer with size limit, abort early if exceeded."""
+    buffer = io.BytesIO()
     total_size = 0
     chunk_size = 64 * 1024  # 64KB chunks
     
-    while True:
-        chunk = await file.read(chunk_size)
-        if not chunk:
-            break
+    while chunk := await file.read(chunk_size):
         total_size += len(chunk)
         if total_size > max_size:
             raise HTTPException(
                 status_code=413,
                 detail=f"File too large. Maximum size is {max_size // (1024*1024)}MB"
             )
-        chunks.append(chunk)
+        buffer.write(chunk)
     
-    return b"".join(chunks)
+    buffer.seek(0)
+    return buffer
 
 @app.get("/health")
 async def health() -> dict[str, str]:
@@ -74,6 +134,7 @@ async def health() -> dict[str, str]:
 async def render_ply(
     file: UploadFile = File(...),
     device: Literal["cuda", "cpu"] | None = None,
+    accept: str | None = Header(default=None),
 ) -> Response:
     filename = file.filename or ""
     if not filename.lower().endswith(".ply"):
@@ -81,11 +142,12 @@ async def render_ply(
 
     payload = await _read_upload_with_limit(file, MAX_UPLOAD_SIZE)
     torch_device = _resolve_device(device)
+    image_format, media_type = _negotiate_format(accept)
 
     try:
-        png_bytes = await asyncio.get_event_loop().run_in_executor(
-            None, lambda: render.grid_from_ply_bytes(payload, torch_device)
-        )
+        image_bytes = await _run_render(lambda: render.grid_from_ply_bytes(payload, torch_device, image_format))
+    except HTTPException:
+        raise
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
     except Exception as exc:
@@ -93,12 +155,14 @@ async def render_ply(
             status_code=500, detail=f"Failed to render uploaded file: {exc}"
         ) from exc
 
-    return Response(content=png_bytes, media_type="image/png")
+    # The body depends on Accept, so shared caches must key on it
+    return Response(content=image_bytes, media_type=media_type, headers={"Vary": "Accept"})
 
 @app.post("/render_glb")
 async def render_glb(
     file: UploadFile = File(...),
     device: Literal["cuda", "cpu"] | None = None,
+    accept: str | None = Header(default=None),
 ) -> Response:
     filename = file.filename or ""
     logger.info(f"render_glb request received: filename={filename!r}")
@@ -108,17 +172,19 @@ async def render_glb(
         raise HTTPException(status_code=400, detail="Only .glb files are supported on /render_glb")
 
     payload = await _read_upload_with_limit(file, MAX_UPLOAD_SIZE)
-    logger.info(f"File uploaded: {len(payload)} bytes")
+    logger.info(f"File uploaded: {payload.getbuffer().nbytes} bytes")
     
     torch_device = _resolve_device(device)
-    logger.debug(f"Using device: {torch_device}")
+    image_format, media_type = _negotiate_format(accept)
+    logger.debug(f"Using device: {torch_device}, output format: {image_format}")
 
     try:
         logger.info("Starting GLB render...")
-        png_bytes = await asyncio.get_event_loop().run_in_executor(
-            None, lambda: render.grid_from_glb_bytes(payload)
-        )
-        logger.info(f"Render complete, returning {len(png_bytes)} bytes")
+        image_bytes = await _run_render(lambda: render.grid_from_glb_bytes(payload, image_format))
+        logger.info(f"Render complete, returning {len(image_bytes)} bytes")
+    except HTTPException:
+        logger.warning("Render queue full, rejecting request")
+        raise
     except ValueError as exc:
         logger.error(f"ValueError during render: {exc}")
         raise HTTPException(status_code=400, detail=str(exc)) from exc
@@ -128,7 +194,7 @@ async def render_glb(
             status_code=500, detail=f"Failed to render uploaded file: {exc}"
         ) from exc
 
-    return Response(content=png_bytes, media_type="image/png")
+    return Response(content=image_bytes, media_type=media_type, headers={"Vary": "Accept"})
 
 if __name__ == "__main__":
     import uvicorn
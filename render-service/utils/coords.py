@@ -34,4 +34,27 @@ def look_at(camera_pos, target=np.zeros(3), up=np.array([0, 1, 0])):
     pose[:3, 1] = up
     pose[:3, 2] = -forward
     pose[:3, 3] = camera_pos
-    return pose
\ No newline at end of file
+    return pose
+
+def look_at_batch(camera_positions, up=np.array([0, 1, 0])):
+    """
+    Create camera-to-world pose matrices for (N, 3) camera positions looking at the origin.
+    Vectorized equivalent of look_at, returns an (N, 4, 4) float32 array.
+    """
+    camera_positions = np.asarray(camera_positions, dtype=np.float32)
+
+    forward = -camera_positions
+    forward /= np.linalg.norm(forward, axis=1, keepdims=True)
+
+    right = np.cross(forward, up)
+    right /= np.linalg.norm(right, axis=1, keepdims=True)
+
+    up = np.cross(right, forward)
+
+    poses = np.zeros((len(camera_positions), 4, 4), dtype=np.float32)
+    poses[:, :3, 0] = right
+    poses[:, :3, 1] = up
+    poses[:, :3, 2] = -forward
+    poses[:, :3, 3] = camera_positions
+    poses[:, 3, 3] = 1.0
+    return poses
@@ -1,23 +1,43 @@
-import requests
+import asyncio
+import httpx
 from pathlib import Path
 
 input_file = "prompts.txt"
 output_dir = Path("images")
 output_dir.mkdir(exist_ok=True)
 
-with open(input_file, "r") as f:
-    urls = [line.strip() for line in f if line.strip()]
+MAX_CONNECTIONS = 32
+# Every pooled connection may stay alive; a lower limit makes httpcore close idle
+# connections instead of handing them to queued downloads
+MAX_KEEPALIVE = MAX_CONNECTIONS
+CONNECT_RETRIES = 3
+CHUNK_SIZE = 1 << 20
 
-for url in urls:
-    filename = url.split("/")[-1]  # keep original name
-    filepath = output_dir / filename
 
+async def fetch(client: httpx.AsyncClient, url: str, filepath: Path):
     print(f"Downloading {url}")
 
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
+    async with client.stream("GET", url) as r:
+        r.raise_for_status()
+
+        with open(filepath, "wb") as img:
+            async for chunk in r.aiter_bytes(CHUNK_SIZE):
+                img.write(chunk)
+
+
+async def download_all(urls: list[str]):
+    # One pooled client per run: keep-alive connections are shared across downloads so
+    # each host pays the TCP+TLS handshake once, and failed connects are retried
+    limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE)
+    transport = httpx.AsyncHTTPTransport(retries=CONNECT_RETRIES, limits=limits)
+    async with httpx.AsyncClient(timeout=30, transport=transport, follow_redirects=True) as client:
+        # keep original name
+        await asyncio.gather(*(fetch(client, url, output_dir / url.split("/")[-1]) for url in urls))
+
+
+with open(input_file, "r") as f:
+    urls = [line.strip() for line in f if line.strip()]
 
-    with open(filepath, "wb") as img:
-        img.write(r.content)
+asyncio.run(download_all(urls))
 
 print("Done.")
@@ -1,12 +1,19 @@
 import argparse
+import asyncio
 import json
 import os
 import sys
-import requests
+import httpx
 from pathlib import Path
 
 BASE_DIR = Path("/root/subnet/404/404-competition-0/rounds")
 RESULT_DIR = Path("result")
+MAX_CONNECTIONS = 32
+# Must not be below MAX_CONNECTIONS: while the pool holds more connections than
+# this, httpcore closes idle ones rather than reusing them for waiting requests
+MAX_KEEPALIVE = MAX_CONNECTIONS
+CONNECT_RETRIES = 3
+CHUNK_SIZE = 1 << 20
 
 
 def parse_args():
@@ -20,17 +27,36 @@ def parse_args():
     return parser.parse_args()
 
 
-def download_png(url: str, output_path: Path):
+async def download_png(client: httpx.AsyncClient, url: str, output_path: Path):
     if output_path.exists():
         print(f"⏭️  Skipping: {output_path.name}")
         return
 
     print(f"⬇️  Downloading: {output_path.name}")
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
+    # Stream into a side file so an interrupted download is never mistaken
+    # for a finished one by the exists() check above
+    part_path = output_path.with_name(output_path.name + ".part")
+    async with client.stream("GET", url) as r:
+        r.raise_for_status()
 
-    with open(output_path, "wb") as f:
-        f.write(r.content)
+        with open(part_path, "wb") as f:
+            async for chunk in r.aiter_bytes(CHUNK_SIZE):
+                f.write(chunk)
+    part_path.replace(output_path)
+
+
+async def _download_all(downloads: list[tuple[str, Path]]):
+    # One pooled client per run: keep-alive connections are shared across downloads so
+    # each host pays the TCP+TLS handshake once, and failed connects are retried
+    limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE)
+    transport = httpx.AsyncHTTPTransport(retries=CONNECT_RETRIES, limits=limits)
+    async with httpx.AsyncClient(timeout=30, transport=transport, follow_redirects=True) as client:
+        await asyncio.gather(*(download_png(client, url, path) for url, path in downloads))
+
+
+def download_many(downloads: list[tuple[str, Path]]):
+    """Download (url, output_path) pairs concurrently over one pooled client"""
+    asyncio.run(_download_all(downloads))
 
 
 def download_from_generations(round_dir: Path, coldkey: str, output_dir: Path):
@@ -44,13 +70,16 @@ def download_from_generations(round_dir: Path, coldkey: str, output_dir: Path):
     with open(json_path, "r", encoding="utf-8") as f:
         generations = json.load(f)
 
+    downloads = []
     for _, data in generations.items():
         png_url = data.get("png")
         if not png_url:
             continue
 
         png_name = os.path.basename(png_url)
-        download_png(png_url, output_dir / png_name)
+        downloads.append((png_url, output_dir / png_name))
+
+    download_many(downloads)
 
 
 def download_from_prompts(round_dir: Path, output_dir: Path):
@@ -60,6 +89,7 @@ def download_from_prompts(round_dir: Path, output_dir: Path):
         print(f"❌ prompts.txt not found: {prompts_path}")
         sys.exit(1)
 
+    downloads = []
     with open(prompts_path, "r", encoding="utf-8") as f:
         for line in f:
             url = line.strip()
@@ -67,7 +97,9 @@ def download_from_prompts(round_dir: Path, output_dir: Path):
                 continue
 
             png_name = os.path.basename(url)
-            download_png(url, output_dir / png_name)
+            downloads.append((url, output_dir / png_name))
+
+    download_many(downloads)
 
 
 def main():
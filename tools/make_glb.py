@@ -4,6 +4,11 @@ from pathlib import Path
 import requests
 from typing import Optional
 
+from multipart_stream import multipart_kwargs
+
+# Input image extensions, as a tuple so a single str.endswith call checks them all
+_IMG_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
 def process_images(
     input_folder: str,
     output_folder: str,
@@ -23,11 +28,11 @@ def process_images(
     output_path = Path(output_folder)
     output_path.mkdir(parents=True, exist_ok=True)
     
-    # Get list of image files
-    input_path = Path(input_folder)
-    image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
-    image_files = [f for f in input_path.iterdir() 
-                   if f.is_file() and f.suffix.lower() in image_extensions]
+    # Get list of image files; scandir entries carry their file type, so only
+    # matching images are turned into Path objects
+    with os.scandir(input_folder) as entries:
+        image_files = [Path(entry.path) for entry in entries
+                       if entry.is_file() and entry.name.lower().endswith(_IMG_EXTS)]
     
     if not image_files:
         print(f"No image files found in {input_folder}")
@@ -47,11 +52,10 @@ def process_images(
         try:
             # Open and read the image file
             with open(image_file, 'rb') as f:
-                files = {'prompt_image_file': (image_file.name, f, 'image/*')}
-                data = {'seed': seed}
+                fields = {'prompt_image_file': (image_file.name, f, 'image/*'), 'seed': seed}
 
-                # Make POST request to the API
-                response = requests.post(api_url, files=files, data=data, stream=True)
+                # Make POST request to the API; the image streams from the open file
+                response = requests.post(api_url, stream=True, **multipart_kwargs(fields))
                 response.raise_for_status()
 
                 # Save the GLB file
@@ -1,12 +1,27 @@
 import os
 import argparse
+import hashlib
+import logging
+import queue
+import shutil
+import threading
 import time
+from functools import partial
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Optional
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from b2sdk.v2 import InMemoryAccountInfo, B2Api
+from b2sdk.v2.exception import Unauthorized
+
+from multipart_stream import multipart_kwargs
+
+# Input image extensions, as a tuple so a single str.endswith call checks them all
+_IMG_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
 
 # NEVER hardcode real keys in production
 APPLICATION_KEY_ID = "0054c1bbe6bcfe7000000001a"
@@ -14,7 +29,74 @@ APPLICATION_KEY = "K005FlRPMrp14TclqSQhrLsYCUaarj8"
 BUCKET_NAME = "404-gen"
 BUCKET_FOLDER = "test/"
 
-def upload_glb_to_b2(glb_path: str, remote_file_name: Optional[str] = None, max_retries: int = 3):
+# Files allowed between "generate started" and "upload finished" beyond one per
+# generate and upload worker, so a saved GLB can wait for an uploader while the
+# next generate starts. The cap keeps a slow upload link from letting finished
+# GLBs and pending futures pile up.
+PIPELINE_SLACK = 2
+
+# Progress messages come from generate callbacks and upload threads; they are
+# queued and written by one listener thread, so workers never wait on stdout
+log = logging.getLogger("upload")
+log.setLevel(logging.INFO)
+
+# One keep-alive session for all generate calls. Connection failures and 503s are
+# retried with backoff. Read errors, 502 and 504 are not: a gateway can return
+# those after the model has started generating, and a resend would run it twice.
+SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3,
+        read=0,
+        backoff_factor=1,
+        status_forcelist=[503],
+        allowed_methods=None,
+    ),
+)
+SESSION.mount("http://", _ADAPTER)
+SESSION.mount("https://", _ADAPTER)
+
+# Authorized bucket shared by all upload threads; authorize_account costs an
+# HTTPS round-trip, so it is done once per process instead of once per file
+_B2_BUCKET = None
+_B2_LOCK = threading.Lock()
+
+
+def _get_bucket():
+    """Return the cached authorized B2 bucket, authorizing on first use."""
+    global _B2_BUCKET
+    with _B2_LOCK:
+        if _B2_BUCKET is None:
+            info = InMemoryAccountInfo()
+            b2_api = B2Api(info)
+
+            b2_api.authorize_account("production", APPLICATION_KEY_ID, APPLICATION_KEY)
+
+            _B2_BUCKET = b2_api.get_bucket_by_name(BUCKET_NAME)
+        return _B2_BUCKET
+
+def _drop_bucket(stale_bucket) -> None:
+    """Forget a bucket whose credentials were rejected so the next call authorizes again."""
+    global _B2_BUCKET
+    with _B2_LOCK:
+        # Another thread may already have replaced it with a freshly authorized one
+        if _B2_BUCKET is stale_bucket:
+            _B2_BUCKET = None
+
+def list_remote_sizes() -> dict:
+    """Return the size of every file already in the B2 folder, keyed by its full B2 name."""
+    bucket = _get_bucket()
+    return {file_version.file_name: file_version.size for file_version, _ in bucket.ls(folder_to_list=BUCKET_FOLDER)}
+
+def upload_glb_to_b2(
+    glb_path: str,
+    remote_file_name: Optional[str] = None,
+    max_retries: int = 3,
+    remote_sizes: Optional[dict] = None,
+    sha1_sum: Optional[str] = None
+):
     """
     Upload a GLB file to Backblaze B2 cloud storage with retry logic.
     
@@ -22,134 +104,260 @@ def upload_glb_to_b2(glb_path: str, remote_file_name: Optional[str] = None, max_
         glb_path: Path to the local GLB file
         remote_file_name: Name to use for the file in B2 (defaults to the local file name)
         max_retries: Maximum number of retry attempts (default: 3)
+        remote_sizes: Sizes from list_remote_sizes(); the upload is skipped when B2
+            already holds a file of the same name and size
+        sha1_sum: SHA-1 hex digest of the file if already known, so b2sdk does not
+            have to compute it from the file again
     """
     if remote_file_name is None:
         remote_file_name = os.path.basename(glb_path)
+
+    if remote_sizes is not None and remote_sizes.get(BUCKET_FOLDER + remote_file_name) == os.path.getsize(glb_path):
+        log.info("Already in B2, skipping upload: %s", remote_file_name)
+        return None
     
     last_exception = None
     
     for attempt in range(max_retries):
+        bucket = None
         try:
-            info = InMemoryAccountInfo()
-            b2_api = B2Api(info)
-
-            b2_api.authorize_account("production", APPLICATION_KEY_ID, APPLICATION_KEY)
-
-            bucket = b2_api.get_bucket_by_name(BUCKET_NAME)
+            bucket = _get_bucket()
 
             local_file_path = glb_path
 
             result = bucket.upload_local_file(
                 local_file=local_file_path,
                 file_name= BUCKET_FOLDER + remote_file_name,
-                content_type="model/gltf-binary"
+                content_type="model/gltf-binary",
+                sha1_sum=sha1_sum
             )
 
-            print(f"Upload complete: {remote_file_name}")
-            print(f"File URL: {bucket.get_download_url(BUCKET_FOLDER + remote_file_name)}")
+            log.info("Upload complete: %s", remote_file_name)
+            log.info("File URL: %s", bucket.get_download_url(BUCKET_FOLDER + remote_file_name))
             return result
             
         except Exception as e:
             last_exception = e
+            # b2sdk renews expired tokens itself; an Unauthorized that still gets here
+            # means the cached authorization is unusable, so only then authorize again
+            if isinstance(e, Unauthorized) and bucket is not None:
+                _drop_bucket(bucket)
             if attempt < max_retries - 1:
                 wait_time = 2 ** attempt  # Exponential backoff: 1s, 2s, 4s
-                print(f"Upload failed for {remote_file_name} (attempt {attempt + 1}/{max_retries}): {e}")
-                print(f"Retrying in {wait_time} seconds...")
+                log.warning("Upload failed for %s (attempt %d/%d): %s", remote_file_name, attempt + 1, max_retries, e)
+                log.warning("Retrying in %d seconds...", wait_time)
                 time.sleep(wait_time)
             else:
-                print(f"Upload failed for {remote_file_name} after {max_retries} attempts: {e}")
+                log.error("Upload failed for %s after %d attempts: %s", remote_file_name, max_retries, e)
     
     # If all retries failed, raise the last exception
     raise last_exception
 
+def _upload_and_cleanup(glb_path: str, remote_file_name: Optional[str] = None, **kwargs):
+    """Upload a GLB like upload_glb_to_b2, then delete the local file once it is in B2."""
+    result = upload_glb_to_b2(glb_path, remote_file_name, **kwargs)
+    os.unlink(glb_path)
+    return result
+
+class _HashingWriter:
+    """File wrapper that feeds every written block into a SHA-1 hash."""
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.sha1 = hashlib.sha1()
+
+    def write(self, data) -> int:
+        self.sha1.update(data)
+        return self._fileobj.write(data)
+
+def _generate_glb(image_file: Path, output_file: Path, api_url: str, seed: int) -> str:
+    """
+    Send one image to the generate API and save the returned GLB.
+    Returns the SHA-1 hex digest of the saved file, computed while it is written.
+
+    Args:
+        image_file: Path to the input image
+        output_file: Path where the GLB file will be written
+        api_url: URL of the serve API endpoint
+        seed: Random seed for generation (-1 for random)
+    """
+    # Open and read the image file
+    with open(image_file, 'rb') as f:
+        fields = {'prompt_image_file': (image_file.name, f, 'image/*'), 'seed': seed}
+
+        # Make POST request to the API
+        response = SESSION.post(api_url, stream=True, **multipart_kwargs(fields))
+        try:
+            response.raise_for_status()
+
+            # Save the GLB file, copying straight from the socket in 1MB blocks.
+            # It is written to a side file and only renamed once complete, so a
+            # broken download is never taken for a finished GLB on the next run
+            response.raw.decode_content = True
+            part_file = output_file.with_name(output_file.name + ".part")
+            try:
+                with open(part_file, 'wb') as out_f:
+                    writer = _HashingWriter(out_f)
+                    shutil.copyfileobj(response.raw, writer, length=1024*1024)
+                os.replace(part_file, output_file)
+            except BaseException:
+                part_file.unlink(missing_ok=True)
+                raise
+        finally:
+            response.close()
+
+    return writer.sha1.hexdigest()
+
 def process_images(
     input_folder: str,
     output_folder: str,
     api_url: str = "http://localhost:8000/generate",
-    seed: int = -1
+    seed: int = -1,
+    concurrency: int = 2,
+    upload_workers: int = 4,
+    delete_after_upload: bool = False,
+    pipeline_depth: Optional[int] = None
 ):
     """
     Process images from input folder and save GLB files to output folder.
-    Uploads to B2 in parallel while processing continues.
+    Generate requests run concurrently, and each GLB is uploaded to B2 as soon
+    as it has been saved while the remaining images are still being generated.
     
     Args:
         input_folder: Path to folder containing input images
         output_folder: Path to folder where GLB files will be saved
         api_url: URL of the serve API endpoint
         seed: Random seed for generation (-1 for random)
+        concurrency: Maximum number of generate requests in flight (default: 2)
+        upload_workers: Number of concurrent B2 uploads (default: 4)
+        delete_after_upload: Delete each local GLB once it has been uploaded, keeping
+            disk usage bounded by the files in flight (default: False)
+        pipeline_depth: Maximum number of files between generate start and upload end;
+            never lower than concurrency + upload_workers (default: that sum + PIPELINE_SLACK)
     """
     # Create output folder if it doesn't exist
     output_path = Path(output_folder)
     output_path.mkdir(parents=True, exist_ok=True)
     
-    # Get list of image files
-    input_path = Path(input_folder)
-    image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
-    image_files = [f for f in input_path.iterdir() 
-                   if f.is_file() and f.suffix.lower() in image_extensions]
+    # Get list of image files; scandir entries carry their file type, so only
+    # matching images are turned into Path objects
+    with os.scandir(input_folder) as entries:
+        image_files = [Path(entry.path) for entry in entries
+                       if entry.is_file() and entry.name.lower().endswith(_IMG_EXTS)]
     
     if not image_files:
-        print(f"No image files found in {input_folder}")
+        log.info("No image files found in %s", input_folder)
         return
     
-    print(f"Found {len(image_files)} images to process")
+    log.info("Found %d images to process", len(image_files))
     
-    # Create thread pool for parallel uploads (max 4 concurrent uploads)
-    upload_executor = ThreadPoolExecutor(max_workers=4)
+    # Create thread pool for parallel uploads
+    upload_executor = ThreadPoolExecutor(max_workers=upload_workers)
     upload_futures = []
+    upload_futures_lock = threading.Lock()
+
+    # Generate requests run on their own pool, which also caps how many are in flight
+    gen_executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    # Taken before a file enters the pipeline, released once its upload is done
+    # or its generate failed
+    min_depth = concurrency + upload_workers
+    if pipeline_depth is None:
+        pipeline_depth = min_depth + PIPELINE_SLACK
+    elif pipeline_depth < min_depth:
+        log.warning("Pipeline depth %d would idle workers, using %d instead", pipeline_depth, min_depth)
+        pipeline_depth = min_depth
+    pipeline_slots = threading.BoundedSemaphore(pipeline_depth)
+
+    # One listing of the B2 folder up front makes every "already uploaded?" check a
+    # dict lookup instead of a metadata request per file
+    try:
+        remote_sizes = list_remote_sizes()
+        log.info("Found %d files already in B2", len(remote_sizes))
+    except Exception as e:
+        log.warning("Could not list B2 files, uploading without checking: %s", e)
+        remote_sizes = None
+
+    def start_upload(output_file: Path, sha1_sum: Optional[str] = None):
+        # Start upload in background immediately
+        future = upload_executor.submit(
+            _upload_and_cleanup if delete_after_upload else upload_glb_to_b2,
+            str(output_file),
+            output_file.name,
+            remote_sizes=remote_sizes,
+            sha1_sum=sha1_sum
+        )
+        future.add_done_callback(lambda _: pipeline_slots.release())
+        with upload_futures_lock:
+            upload_futures.append((future, output_file.name))
+        log.info("  ⬆ Upload started for %s", output_file.name)
+
+    def on_generated(gen_future, image_file: Path, output_file: Path):
+        try:
+            sha1_sum = gen_future.result()
+        except requests.exceptions.RequestException as e:
+            log.error("  ✗ Error processing %s: %s", image_file.name, e)
+            pipeline_slots.release()
+            return
+        except Exception as e:
+            log.error("  ✗ Unexpected error processing %s: %s", image_file.name, e)
+            pipeline_slots.release()
+            return
+
+        log.info("  ✓ Saved to %s", output_file)
+        start_upload(output_file, sha1_sum)
     
     # Process each image
     for idx, image_file in enumerate(image_files, 1):
         output_file = output_path / f"{image_file.stem}.glb"
         if output_file.exists():
-            print(f"Skipping {idx}/{len(image_files)}: {image_file.name} (exists: {output_file})")
+            log.info("Skipping %d/%d: %s (exists: %s)", idx, len(image_files), image_file.name, output_file)
+            # Finish uploads that failed or never ran in an earlier run
+            if remote_sizes is not None and remote_sizes.get(BUCKET_FOLDER + output_file.name) != output_file.stat().st_size:
+                pipeline_slots.acquire()
+                start_upload(output_file)
             continue
 
-        print(f"Processing {idx}/{len(image_files)}: {image_file.name}")
+        # Uploaded GLBs are no longer on disk, so B2 is the record of what is done
+        if delete_after_upload and remote_sizes is not None and BUCKET_FOLDER + output_file.name in remote_sizes:
+            log.info("Skipping %d/%d: %s (already in B2)", idx, len(image_files), image_file.name)
+            continue
 
-        try:
-            # Open and read the image file
-            with open(image_file, 'rb') as f:
-                files = {'prompt_image_file': (image_file.name, f, 'image/*')}
-                data = {'seed': seed}
-
-                # Make POST request to the API
-                response = requests.post(api_url, files=files, data=data, stream=True)
-                response.raise_for_status()
-
-                # Save the GLB file
-                with open(output_file, 'wb') as out_f:
-                    for chunk in response.iter_content(chunk_size=1024*1024):
-                        if chunk:
-                            out_f.write(chunk)
-
-                print(f"  ✓ Saved to {output_file}")
-                
-                # Start upload in background immediately
-                future = upload_executor.submit(
-                    upload_glb_to_b2,
-                    str(output_file),
-                    output_file.name
-                )
-                upload_futures.append((future, output_file.name))
-                print(f"  ⬆ Upload started for {output_file.name}")
+        pipeline_slots.acquire()
+        log.info("Processing %d/%d: %s", idx, len(image_files), image_file.name)
 
-        except requests.exceptions.RequestException as e:
-            print(f"  ✗ Error processing {image_file.name}: {e}")
-        except Exception as e:
-            print(f"  ✗ Unexpected error: {e}")
+        gen_future = gen_executor.submit(_generate_glb, image_file, output_file, api_url, seed)
+        gen_future.add_done_callback(
+            partial(on_generated, image_file=image_file, output_file=output_file)
+        )
+
+    # Every generate (and its done callback) has finished once the pool is shut down
+    gen_executor.shutdown(wait=True)
     
-    # Wait for all uploads to complete
-    print(f"\nWaiting for {len(upload_futures)} uploads to complete...")
-    for idx, (future, filename) in enumerate(upload_futures, 1):
+    # Wait for all uploads to complete, reporting each one as soon as it finishes
+    log.info("Waiting for %d uploads to complete...", len(upload_futures))
+    future_to_name = dict(upload_futures)
+    for idx, future in enumerate(as_completed(future_to_name), 1):
+        filename = future_to_name[future]
         try:
             result = future.result()
-            print(f"  ✓ Upload complete ({idx}/{len(upload_futures)}): {filename}")
+            log.info("  ✓ Upload complete (%d/%d): %s", idx, len(upload_futures), filename)
         except Exception as e:
-            print(f"  ✗ Upload failed ({idx}/{len(upload_futures)}): {filename} - {e}")
+            log.error("  ✗ Upload failed (%d/%d): %s - %s", idx, len(upload_futures), filename, e)
     
     upload_executor.shutdown(wait=True)
-    print("\nAll processing and uploads complete!")
+    log.info("All processing and uploads complete!")
+
+def _start_log_listener() -> QueueListener:
+    """Route the upload logger through a queue drained by a background StreamHandler."""
+    log_queue = queue.Queue(-1)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = QueueListener(log_queue, handler)
+    log.addHandler(QueueHandler(log_queue))
+    log.propagate = False
+    listener.start()
+    return listener
 
 def main():
     parser = argparse.ArgumentParser(
@@ -180,15 +388,49 @@ def main():
         default=42,
         help='Random seed for generation (default: -1 for random)'
     )
+    parser.add_argument(
+        '--concurrency',
+        '-c',
+        type=int,
+        default=2,
+        help='Maximum number of generate requests in flight (default: 2)'
+    )
+    parser.add_argument(
+        '--upload-workers',
+        type=int,
+        default=4,
+        help='Number of concurrent B2 uploads (default: 4)'
+    )
+    parser.add_argument(
+        '--delete-after-upload',
+        action='store_true',
+        help='Delete each local GLB once it has been uploaded to B2'
+    )
+    parser.add_argument(
+        '--pipeline-depth',
+        type=int,
+        default=None,
+        help='Maximum number of files being generated or uploaded at once '
+             f'(default: concurrency + upload workers + {PIPELINE_SLACK})'
+    )
     
     args = parser.parse_args()
-    
-    process_images(
-        input_folder=args.input,
-        output_folder=args.output,
-        api_url=args.api_url,
-        seed=args.seed
-    )
+
+    listener = _start_log_listener()
+    try:
+        process_images(
+            input_folder=args.input,
+            output_folder=args.output,
+            api_url=args.api_url,
+            seed=args.seed,
+            concurrency=args.concurrency,
+            upload_workers=args.upload_workers,
+            delete_after_upload=args.delete_after_upload,
+            pipeline_depth=args.pipeline_depth
+        )
+    finally:
+        # Flushes any queued messages before the process exits
+        listener.stop()
 
 if __name__ == "__main__":
     main()
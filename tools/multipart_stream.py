@@ -0,0 +1,54 @@
+"""Multipart/form-data request bodies that stream from open files.
+
+requests encodes `files=` uploads into one in-memory bytes object before
+sending. With requests-toolbelt installed the body is streamed from the file
+handles instead; without it the tools fall back to plain `files=` uploads.
+"""
+import io
+
+try:
+    from requests_toolbelt import MultipartEncoder
+except ImportError:
+    MultipartEncoder = None
+else:
+
+    class _RewindableEncoder(MultipartEncoder):
+        """MultipartEncoder that urllib3 can rewind, so a retried request resends the whole body."""
+
+        def __init__(self, fields: dict):
+            super().__init__(fields=fields)
+            self._sent = 0
+
+        def read(self, size: int = -1) -> bytes:
+            chunk = super().read(size)
+            self._sent += len(chunk)
+            return chunk
+
+        def tell(self) -> int:
+            return self._sent
+
+        def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+            if offset != 0 or whence != io.SEEK_SET:
+                raise io.UnsupportedOperation("multipart body can only be rewound to the start")
+            for value in self.fields.values():
+                if isinstance(value, tuple) and hasattr(value[1], "seek"):
+                    value[1].seek(0)
+            super().__init__(fields=self.fields, boundary=self.boundary_value)
+            self._sent = 0
+            return 0
+
+
+def multipart_kwargs(fields: dict) -> dict:
+    """
+    Build keyword arguments for session.post() that send fields as multipart/form-data.
+
+    Args:
+        fields: Form fields; file fields are (filename, file_object, content_type) tuples
+    """
+    if MultipartEncoder is None:
+        files = {name: value for name, value in fields.items() if isinstance(value, tuple)}
+        data = {name: value for name, value in fields.items() if not isinstance(value, tuple)}
+        return {"files": files, "data": data or None}
+
+    encoder = _RewindableEncoder({name: value if isinstance(value, tuple) else str(value) for name, value in fields.items()})
+    return {"data": encoder, "headers": {"Content-Type": encoder.content_type}}
@@ -10,11 +10,16 @@ and writes the returned image bytes to the specified output file.
 from __future__ import annotations
 import argparse
 import os
-import sys
+import shutil
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Iterable
 
+from multipart_stream import multipart_kwargs
+
+log = logging.getLogger(__name__)
+
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Upload .glb file or folder to render service and save PNG(s)")
@@ -23,46 +28,69 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--url", default="http://localhost:9000/render_glb", help="Render service URL")
     p.add_argument("--device", choices=("cuda", "cpu"), help="Device to request from service")
     p.add_argument("--timeout", type=float, default=120.0, help="Request timeout in seconds")
+    p.add_argument("--workers", type=int, default=4, help="Number of files uploaded concurrently")
     return p.parse_args()
 
 
+def make_session(requests, pool_size: int):
+    """Build a keep-alive session that retries connection failures and 503 responses."""
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    # The service answers 503 before rendering when its queue is full. Read errors,
+    # 502 and 504 can arrive after rendering started, so those are not resent.
+    retry = Retry(total=3, read=0, backoff_factor=1, status_forcelist=[503], allowed_methods=None)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 def find_glb_files(root: Path) -> list[Path]:
     if root.is_file():
         return [root]
-    files = [p for p in sorted(root.iterdir()) if p.is_file() and p.suffix.lower() == ".glb"]
+    with os.scandir(root) as entries:
+        files = sorted(Path(e.path) for e in entries if e.is_file() and e.name.lower().endswith(".glb"))
     return files
 
 
 def upload_and_save(session, url: str, path: Path, out_path: Path, device: str | None, timeout: float) -> bool:
     with path.open("rb") as fh:
-        files = {"file": (path.name, fh, "model/gltf-binary")}
-        data = {}
+        fields = {"file": (path.name, fh, "model/gltf-binary")}
         if device:
-            data["device"] = device
+            fields["device"] = device
         try:
-            resp = session.post(url, files=files, data=data or None, timeout=timeout)
+            # The file handle stays open while the body streams from it
+            resp = session.post(url, timeout=timeout, stream=True, **multipart_kwargs(fields))
         except Exception as e:
-            print(f"Request failed for {path}: {e}", file=sys.stderr)
+            log.error("Request failed for %s: %s", path, e)
             return False
 
-    if resp.status_code != 200:
-        print(f"Server returned {resp.status_code} for {path}: {resp.text}", file=sys.stderr)
-        return False
+    try:
+        if resp.status_code != 200:
+            log.error("Server returned %s for %s: %s", resp.status_code, path, resp.text)
+            return False
 
-    ctype = resp.headers.get("content-type", "")
-    if not ctype.startswith("image/"):
-        print(f"Unexpected content-type for {path}: {ctype}", file=sys.stderr)
-        return False
+        ctype = resp.headers.get("content-type", "")
+        if not ctype.startswith("image/"):
+            log.error("Unexpected content-type for %s: %s", path, ctype)
+            return False
 
-    try:
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        with out_path.open("wb") as out_f:
-            out_f.write(resp.content)
-    except OSError as e:
-        print(f"Failed to write {out_path}: {e}", file=sys.stderr)
-        return False
-
-    print(f"Saved render: {out_path}")
+        try:
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            # Write the image as it arrives instead of buffering resp.content first
+            resp.raw.decode_content = True
+            with out_path.open("wb") as out_f:
+                shutil.copyfileobj(resp.raw, out_f, length=1 << 20)
+        except Exception as e:
+            log.error("Failed to write %s: %s", out_path, e)
+            out_path.unlink(missing_ok=True)
+            return False
+    finally:
+        resp.close()
+
+    log.info("Saved render: %s", out_path)
     return True
 
 
@@ -70,19 +98,19 @@ def main() -> int:
     args = parse_args()
     inp = Path(args.input)
     if not inp.exists():
-        print(f"Input not found: {inp}", file=sys.stderr)
+        log.error("Input not found: %s", inp)
         return 2
 
     try:
         import requests
     except Exception:
-        print("Missing dependency: requests. Install with: pip install requests", file=sys.stderr)
+        log.error("Missing dependency: requests. Install with: pip install requests")
         return 3
 
     # Determine list of .glb files
     glb_files = find_glb_files(inp)
     if not glb_files:
-        print(f"No .glb files found in {inp}", file=sys.stderr)
+        log.error("No .glb files found in %s", inp)
         return 2
 
     # Determine output paths
@@ -103,17 +131,20 @@ def main() -> int:
 
     successes = 0
     failures = 0
-    session = requests.Session()
-    for p in glb_files:
-        target_name = p.stem + ".png"
-        target = out_dir / target_name
-        ok = upload_and_save(session, args.url, p, target, args.device, args.timeout)
-        if ok:
-            successes += 1
-        else:
-            failures += 1
+    session = make_session(requests, pool_size=args.workers)
+    # Requests are independent, so the service renders one file while others upload or download
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(upload_and_save, session, args.url, p, out_dir / (p.stem + ".png"), args.device, args.timeout)
+            for p in glb_files
+        ]
+        for future in as_completed(futures):
+            if future.result():
+                successes += 1
+            else:
+                failures += 1
 
-    print(f"Done. success={successes} fail={failures}")
+    log.info("Done. success=%d fail=%d", successes, failures)
     return 0 if failures == 0 else 1
 
 